@@ -0,0 +1,34 @@
+"""Process-wide singletons for the heavy text models.
+
+en_core_web_lg is ~800MB resident and CLIP adds more. With the 'fork'
+start method the DataLoader workers inherit these pages copy-on-write,
+so N workers share one copy instead of each holding their own — but only
+if every consumer references the same read-only module-level object.
+Datasets must therefore fetch the models from here (before the workers
+fork, i.e. in __init__ in the main process) instead of loading their own.
+"""
+import spacy
+
+import CLIP
+
+NLP = None
+CLIP_MODEL = None
+_CLIP_TYPE = None
+
+
+def get_nlp():
+    global NLP
+    if NLP is None:
+        NLP = spacy.load('en_core_web_lg', disable=['ner', 'lemmatizer'])
+    return NLP
+
+
+def get_clip(clip_type, device):
+    global CLIP_MODEL, _CLIP_TYPE
+    if CLIP_MODEL is None:
+        CLIP_MODEL, _ = CLIP.load(clip_type, device=device)
+        _CLIP_TYPE = clip_type
+    else:
+        assert _CLIP_TYPE == clip_type, \
+            f"CLIP already loaded as {_CLIP_TYPE}, requested {clip_type}"
+    return CLIP_MODEL
@@ -84,6 +84,12 @@ class BaseOptions(object):
         parser.add_argument("--ctx_mode", type=str, default="video_tef")
         parser.add_argument("--use_cliptext", type=str, default=None)
         parser.add_argument("--text_ratio", type=float, default=0.5)
+        parser.add_argument("--clip_text_cache_dir", type=str, default=None,
+                            help="dir with CLIP text features precomputed by "
+                                 "scripts/precompute_clip.py; skips in-worker CLIP/spaCy")
+        parser.add_argument("--defer_clip_text", action="store_true",
+                            help="workers only tokenize queries; CLIP runs once per "
+                                 "batch in the main process instead of per sample")
         parser.add_argument('--m_classes', type=str, default=None)
 
 
@@ -3,6 +3,7 @@ from tqdm import tqdm, trange
 import numpy as np
 import os
 from collections import OrderedDict, defaultdict
+from functools import partial
 from utils.basic_utils import AverageMeter
 
 import torch
@@ -104,7 +105,9 @@ def compute_hl_results(model, eval_loader, opt, epoch_i=None, criterion=None, tb
     for batch in tqdm(eval_loader, desc="compute st ed scores"):
         query_meta = batch[0]
         if opt.a_feat_dir is None:
-            model_inputs, targets = prepare_batch_inputs(batch[1], opt.device, non_blocking=opt.pin_memory)
+            model_inputs, targets = prepare_batch_inputs(
+                batch[1], opt.device, non_blocking=opt.pin_memory,
+                clip_text_encoder=getattr(eval_loader.dataset, "encode_text_batch", None))
         else:
             model_inputs, targets = prepare_batch_inputs_audio(batch[1], opt.device, non_blocking=opt.pin_memory)
         outputs = model(**model_inputs)
@@ -185,7 +188,9 @@ def compute_mr_results(model, eval_loader, opt, epoch_i=None, criterion=None, tb
     for batch in tqdm(eval_loader, desc="compute st ed scores"):
         query_meta = batch[0]
         if opt.a_feat_dir is None:
-            model_inputs, targets = prepare_batch_inputs(batch[1], opt.device, non_blocking=opt.pin_memory)
+            model_inputs, targets = prepare_batch_inputs(
+                batch[1], opt.device, non_blocking=opt.pin_memory,
+                clip_text_encoder=getattr(eval_loader.dataset, "encode_text_batch", None))
         else:
             model_inputs, targets = prepare_batch_inputs_audio(batch[1], opt.device, non_blocking=opt.pin_memory)
         outputs = model(**model_inputs)
@@ -270,7 +275,11 @@ def eval_epoch(model, eval_dataset, opt, save_submission_filename, epoch_i=None,
     if opt.a_feat_dir is None:
         eval_loader = DataLoader(
             eval_dataset,
-            collate_fn=start_end_collate,
+            collate_fn=partial(start_end_collate, max_v_l=opt.max_v_l,
+                               # cliptext query lengths can exceed max_q_l (e.g. the
+                               # hidden_features extra row) and tvsum token features
+                               # are never truncated, keep those variable
+                               max_q_l=None if (opt.use_cliptext or opt.dset_name == 'tvsum') else opt.max_q_l),
             batch_size=opt.eval_bsz,
             num_workers=opt.num_workers,
             shuffle=False,
@@ -373,6 +382,8 @@ def start_inference(train_opt=None, split=None, splitfile=None):
             ctx_mode=opt.ctx_mode,
             use_cliptext=opt.use_cliptext,
             text_ratio=opt.text_ratio,
+            clip_text_cache_dir=opt.clip_text_cache_dir,
+            defer_clip_text=opt.defer_clip_text,
             data_ratio=opt.data_ratio,
             normalize_v=not opt.no_norm_vfeat,
             normalize_t=not opt.no_norm_tfeat,
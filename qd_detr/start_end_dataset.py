@@ -4,18 +4,96 @@ import numpy as np
 from tqdm import tqdm
 import random
 import logging
+from functools import lru_cache
 from os.path import join, exists
 from utils.basic_utils import load_jsonl, l2_normalize_np_array
 from utils.tensor_utils import pad_sequences_1d
 from qd_detr.span_utils import span_xx_to_cxw
-import CLIP
 import clip
 
-import spacy
+from qd_detr._heavy_models import get_nlp, get_clip
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the numpy path works without it
+    njit = None
 
 logger = logging.getLogger(__name__)
 
 
+def _saliency_score_and_negmask(rel, agg, ctx_l):
+    """Fused per-sample kernel: clip-level score array plus the boolean mask
+    of non-relevant clips (the easy-negative pool). Vectorized numpy; swapped
+    for the numba-compiled loop form below when numba is installed."""
+    score_array = np.zeros(max(ctx_l, rel.max() + 1))
+    score_array[rel] = agg
+    neg_mask = np.ones(ctx_l, dtype=np.bool_)
+    neg_mask[rel[rel < ctx_l]] = False
+    return score_array, neg_mask
+
+
+def _saliency_score_and_negmask_loop(rel, agg, ctx_l):
+    # element-wise form that numba can compile; only used through njit below
+    score_len = ctx_l
+    for i in range(len(rel)):
+        if rel[i] + 1 > score_len:
+            score_len = rel[i] + 1
+    score_array = np.zeros(score_len)
+    neg_mask = np.ones(ctx_l, dtype=np.bool_)
+    for i in range(len(rel)):
+        score_array[rel[i]] = agg[i]
+        if rel[i] < ctx_l:
+            neg_mask[rel[i]] = False
+    return score_array, neg_mask
+
+
+if njit is not None:
+    _saliency_score_and_negmask = njit(cache=True)(_saliency_score_and_negmask_loop)
+
+
+@lru_cache(maxsize=128)
+def _make_tef(ctx_l):
+    """(Lv, 2) temporal endpoint features; ctx_l is bounded by max_v_l, so the
+    few distinct tensors are built once and shared (safe: torch.cat copies)."""
+    tef_st = torch.arange(0, ctx_l, dtype=torch.float32) / ctx_l
+    tef_ed = tef_st + 1.0 / ctx_l
+    return torch.stack([tef_st, tef_ed], dim=1)
+
+
+def extract_noun_phrase(doc, need_index=False):
+
+    # chunk_of[i] is the id of the noun chunk covering token i, -1 otherwise
+    chunk_of = np.full(len(doc), -1, dtype=np.int32)
+    chunks = []
+    for ci, chunk in enumerate(doc.noun_chunks):
+        chunk_of[chunk.start:chunk.end] = ci
+        chunks.append(chunk)
+
+    for token in doc:
+        if token.head.i == token.i:
+            head = token.head
+
+    if chunk_of[head.i] == -1:
+        children = list(head.children)
+        if children and chunk_of[children[0].i] != -1:
+            head = children[0]
+        else:
+            if need_index:
+                return doc.text, [], doc.text
+            else:
+                return doc.text
+
+    phrase_mask = chunk_of == chunk_of[head.i]
+    phrase_index = np.nonzero(phrase_mask)[0].tolist()
+    not_phrase_index = np.nonzero(~phrase_mask)[0].tolist()
+
+    head_chunk = chunks[chunk_of[head.i]]
+    if need_index:
+        return head_chunk.text, phrase_index, not_phrase_index
+    else:
+        return head_chunk.text
+
+
 class StartEndDataset(Dataset):
     Q_FEAT_TYPES = ["pooler_output", "last_hidden_state"]
     """One line in data loaded from data_path."
@@ -32,6 +110,7 @@ class StartEndDataset(Dataset):
     def __init__(self, dset_name, data_path, v_feat_dirs, q_feat_dir,
                  q_feat_type="last_hidden_state",
                  max_q_l=32, max_v_l=75, data_ratio=1.0, ctx_mode="video", use_cliptext=None, text_ratio=0.5,
+                 clip_text_cache_dir=None, defer_clip_text=False,
                  normalize_v=True, normalize_t=True, load_labels=True,
                  clip_len=2, max_windows=5, span_loss_type="l1", txt_drop_ratio=0,
                  dset_domain=None,
@@ -56,6 +135,9 @@ class StartEndDataset(Dataset):
         self.max_windows = max_windows  # maximum number of windows to use as labels
         self.span_loss_type = span_loss_type
         self.txt_drop_ratio = txt_drop_ratio
+        # hoisted out of __getitem__, string checks add up over N*epochs calls
+        self._is_tvsum = dset_name == 'tvsum'
+        self._is_subs_train = "subs_train" in data_path
         if "val" in data_path or "test" in data_path:
             assert txt_drop_ratio == 0
 
@@ -66,7 +148,7 @@ class StartEndDataset(Dataset):
         self.data = self.load_data()
         
         # load specific domain data for tvsum dataset
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             target_domain = dset_domain
             assert target_domain in ["BK", "BT", "DS", "FM", "GA", "MS", "PK", "PR", "VT", "VU"]
 
@@ -76,20 +158,52 @@ class StartEndDataset(Dataset):
                     new_data.append(d)
             self.data = new_data
 
+            # tvsum has no span annotations; share one read-only zero tensor
+            # instead of constructing it every __getitem__
+            self._tvsum_zero_span = torch.zeros(1, 2)
+
         if self.use_cliptext:
             print(f"++++++++++++++++++++++ CLIP {self.use_cliptext} +++++++++++++++++++++++++++++++++")
 
             clip_type, self.text_type = self.use_cliptext.split(' ')
 
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            self.clip_model, _ = CLIP.load(clip_type, device=self.device)
+            self.clip_text_cache_dir = None
+            # workers only tokenize; encode_text_batch runs once per batch in
+            # the main process (see prepare_batch_inputs)
+            self.defer_clip_text = defer_clip_text and not self._is_tvsum
+            # tvsum query features come from {qid}.npz tokens in q_feat_dir,
+            # which precompute_clip.py does not produce — same exemption as
+            # defer_clip_text above
+            if clip_text_cache_dir is not None and exists(clip_text_cache_dir) \
+                    and not self._is_tvsum:
+                # features were precomputed by scripts/precompute_clip.py,
+                # no CLIP / spaCy needed at loading time
+                self.clip_text_cache_dir = clip_text_cache_dir
+                self.defer_clip_text = False
+            else:
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                # module-level singletons, shared copy-on-write across forked
+                # workers (see qd_detr/_heavy_models.py)
+                self.clip_model = get_clip(clip_type, self.device)
+
+                self.nlp = get_nlp()
+
+                # parse all queries in one batched pass, per-call spaCy overhead
+                # dominates for short queries
+                queries = [d["query"].lower() for d in self.data]
+                docs = self.nlp.pipe(queries, batch_size=256)
+                self._doc_cache = {d["qid"]: doc for d, doc in zip(self.data, docs)}
 
-            self.nlp = spacy.load('en_core_web_lg')
+                # lazily filled (qid -> (tokens, pad_start)) cache, the CLIP
+                # BPE then runs once per query instead of once per epoch;
+                # per-worker copies under fork are fine
+                self._tok_cache = {}
 
             self.text_ratio = text_ratio
 
         if m_classes is not None:
             self.m_vals = [int(v) for v in m_classes[1:-1].split(',')]
+            self._m_vals_np = np.asarray(self.m_vals)
         else:
             self.m_vals=None
         
@@ -113,31 +227,39 @@ class StartEndDataset(Dataset):
         if self.use_cliptext is None:
             model_inputs["query_feat"] = self._get_query_feat_by_qid(meta["qid"])  # (Dq, ) or (Lq, Dq)
         else:
-            if self.text_type == 'org_hidden_state':
+            if self.clip_text_cache_dir is not None:
+                model_inputs["query_feat"] = self._get_cached_text_feat(meta["qid"])
+
+            elif self.defer_clip_text:
+                # tokens only; the CLIP forward runs batched per step instead
+                # of per sample inside the workers
+                model_inputs["query_tokens"] = self._get_query_tokens(meta["qid"])
+
+            elif self.text_type == 'org_hidden_state':
                 # sentence -> last hidden state
-                model_inputs["query_feat"] = self._get_clip_text_feat(meta["query"])  # (Dq, ) or (Lq, Dq)
+                model_inputs["query_feat"] = self._get_clip_text_feat(meta["qid"], meta["query"])  # (Dq, ) or (Lq, Dq)
 
             elif self.text_type == 'global_local_features':
                 # sentence -> final feature (global)
                 # noun -> final feature (local)
                 # final = global + local
-                model_inputs["query_feat"] = self._get_global_local_features(meta["query"], self.text_ratio)
+                model_inputs["query_feat"] = self._get_global_local_features(meta["qid"], self.text_ratio)
 
             elif self.text_type == 'hidden_features':
                 # sentence -> last hidden state
                 # sen + noun -> final feature
                 # final = last hidden state + final feature
-                model_inputs["query_feat"] = self._get_hidden_features(meta["query"], self.text_ratio)
+                model_inputs["query_feat"] = self._get_hidden_features(meta["qid"], self.text_ratio)
 
             elif self.text_type == 'global_local_hidden_state':
                 # sentence -> last hidden state (global)
                 # noun -> last hidden state (local)
                 # final = local + global
-                model_inputs["query_feat"] = self._get_global_local_hidden_states(meta["query"], self.text_ratio)
+                model_inputs["query_feat"] = self._get_global_local_hidden_states(meta["qid"], self.text_ratio)
 
             elif self.text_type == 'only_local_hidden_state':
                 # noun -> last hidden state (local)
-                model_inputs["query_feat"] = self._get_only_noun_hidden_states(meta["query"])
+                model_inputs["query_feat"] = self._get_only_noun_hidden_states(meta["qid"])
 
                 
         if self.use_video:
@@ -147,39 +269,35 @@ class StartEndDataset(Dataset):
             ctx_l = self.max_v_l
 
         if self.use_tef:
-            tef_st = torch.arange(0, ctx_l, 1.0) / ctx_l
-            tef_ed = tef_st + 1.0 / ctx_l
-            tef = torch.stack([tef_st, tef_ed], dim=1)  # (Lv, 2)
+            tef = _make_tef(ctx_l)  # (Lv, 2)
             if self.use_video:
-                model_inputs["video_feat"] = torch.cat(
-                    [model_inputs["video_feat"], tef], dim=1)  # (Lv, Dv+2)
+                # concatenated onto the padded batch in start_end_collate, so
+                # no fresh (Lv, Dv+2) tensor is allocated per sample
+                model_inputs["tef"] = tef
             else:
                 model_inputs["video_feat"] = tef
 
         if self.load_labels:
-            if self.dset_name == 'tvsum': 
-                model_inputs["span_labels"] = torch.tensor([[0., 0.]])
+            if self._is_tvsum:
+                model_inputs["span_labels"] = self._tvsum_zero_span
                 meta_label = meta['label']
                 model_inputs["saliency_pos_labels"], model_inputs["saliency_neg_labels"], model_inputs["saliency_all_labels"] = \
                             self.get_saliency_labels_all_tvsum(meta_label, ctx_l)
             else:
                 model_inputs["span_labels"], lengths = self.get_span_labels(meta["relevant_windows"], ctx_l)  # (#windows, 2)
-                if "subs_train" not in self.data_path:
+                if not self._is_subs_train:
                     model_inputs["saliency_pos_labels"], model_inputs["saliency_neg_labels"], model_inputs["saliency_all_labels"] = \
                         self.get_saliency_labels_all(meta["relevant_clip_ids"], meta["saliency_scores"], ctx_l)
                 else:
                     model_inputs["saliency_pos_labels"], model_inputs["saliency_neg_labels"], model_inputs["saliency_all_labels"] = \
                         self.get_saliency_labels_sub_as_query(meta["relevant_windows"][0], ctx_l)  # only one gt
 
-        moment_class = []
         if self.m_vals is not None:
-            for l in lengths:
-                for m_cls, m_val in enumerate(self.m_vals):
-                    if l <= m_val:
-                        moment_class.append(m_cls)
-                        break
-            model_inputs["moment_class"] = torch.tensor(moment_class)
-            
+            # m_vals is sorted, so one searchsorted call buckets all lengths
+            moment_class = np.searchsorted(self._m_vals_np, np.asarray(lengths), side='left')
+            moment_class = np.minimum(moment_class, len(self._m_vals_np) - 1)
+            model_inputs["moment_class"] = torch.from_numpy(moment_class).long()
+
             assert len(model_inputs["moment_class"]) == len(lengths)
                     
         return dict(meta=meta, model_inputs=model_inputs)
@@ -191,12 +309,16 @@ class StartEndDataset(Dataset):
             gt_st = gt_ed
 
         if gt_st != gt_ed:
-            pos_clip_indices = random.sample(range(gt_st, gt_ed+1), k=max_n)
+            pos_clip_indices = np.random.choice(
+                np.arange(gt_st, gt_ed+1), size=max_n, replace=False).tolist()
         else:
             pos_clip_indices = [gt_st, gt_st]
 
-        neg_pool = list(range(0, gt_st)) + list(range(gt_ed+1, ctx_l))
-        neg_clip_indices = random.sample(neg_pool, k=max_n)
+        # mask out the gt window instead of materializing two Python ranges
+        neg_mask = np.ones(ctx_l, dtype=bool)
+        neg_mask[gt_st:gt_ed+1] = False
+        neg_pool = np.nonzero(neg_mask)[0]
+        neg_clip_indices = np.random.choice(neg_pool, size=max_n, replace=False).tolist()
         # return pos_clip_indices, neg_clip_indices
         
         score_array = np.zeros(ctx_l)
@@ -255,16 +377,8 @@ class StartEndDataset(Dataset):
         agg_scores = np.sum(scores, 1)  # (#rel_clips, )
         sort_indices = np.argsort(agg_scores)  # increasing
 
-        # score_array = [min(agg_scores[idx], ctx_l-1) for idx in range(ctx_l)]
-        score_array = np.zeros(ctx_l)
-        for idx in range(len(rel_clip_ids)):
-            if rel_clip_ids[idx] >= ctx_l:
-                score_array_new = np.zeros(ctx_l + 1)
-                score_array_new[:ctx_l] = score_array
-                score_array = score_array_new
-            # if rel_clip_ids[idx] == ctx_l:
-            #     print(rel_clip_ids[idx], ctx_l)
-            score_array[rel_clip_ids[idx]] = agg_scores[idx]
+        rel = np.asarray(rel_clip_ids, dtype=np.int64)
+        score_array, easy_neg_mask = _saliency_score_and_negmask(rel, agg_scores, ctx_l)
 
         # indices in the whole video
         # the min(_, ctx_l-1) here is incorrect, but should not cause
@@ -274,7 +388,7 @@ class StartEndDataset(Dataset):
         easy_pos_clip_indices = []
         easy_neg_clip_indices = []
         if add_easy_negative:
-            easy_neg_pool = list(set(range(ctx_l)) - set(rel_clip_ids))
+            easy_neg_pool = np.nonzero(easy_neg_mask)[0].tolist()
             if len(easy_neg_pool) >= max_n:
                 easy_pos_clip_indices = random.sample(rel_clip_ids, k=max_n)
                 easy_neg_clip_indices = random.sample(easy_neg_pool, k=max_n)
@@ -325,44 +439,246 @@ class StartEndDataset(Dataset):
             lengths.append(w[1]-w[0])
 
         if self.span_loss_type == "l1":
-            windows = torch.Tensor(windows) / (ctx_l * self.clip_len)  # normalized windows in xx
+            windows = torch.from_numpy(
+                np.asarray(windows, dtype=np.float32)) / (ctx_l * self.clip_len)  # normalized windows in xx
             windows = span_xx_to_cxw(windows)  # normalized windows in cxw
         elif self.span_loss_type == "ce":
-            windows = torch.Tensor([
+            windows = torch.from_numpy(np.asarray([
                 [int(w[0] / self.clip_len), min(int(w[1] / self.clip_len), ctx_l) - 1]
-                for w in windows]).long()  # inclusive
+                for w in windows], dtype=np.int64))  # inclusive
         else:
             raise NotImplementedError
         return windows, lengths
 
     def _get_query_feat_by_qid(self, qid):
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
-            q_feat_path = join(self.q_feat_dir, f"qid{qid}.npz")
-            q_feat = np.load(q_feat_path)[self.q_feat_type].astype(np.float32)
+            q_feat_npy_path = join(self.q_feat_dir, f"qid{qid}.npy")
+            from_npy_cache = exists(q_feat_npy_path)
+            if from_npy_cache:
+                # converted by scripts/convert_features_to_npy.py; mmap so only
+                # the needed prefix is read
+                q_feat = np.load(q_feat_npy_path, mmap_mode='r')
+            else:
+                q_feat = np.load(join(self.q_feat_dir, f"qid{qid}.npz"))[self.q_feat_type]
             if self.q_feat_type == "last_hidden_state":
                 q_feat = q_feat[:self.max_q_l]
-            if self.normalize_t:
+            q_feat = q_feat.astype(np.float32)
+            # .npy caches are already L2-normalized at conversion time
+            if self.normalize_t and not from_npy_cache:
                 q_feat = l2_normalize_np_array(q_feat)
             if self.txt_drop_ratio > 0:
                 q_feat = self.random_drop_rows(q_feat)
         return torch.from_numpy(q_feat)  # (D, ) or (Lq, D)
 
-    def _get_clip_text_feat(self, query):
-        if self.dset_name == 'tvsum':
+    def _get_cached_text_feat(self, qid):
+        """Assemble query_feat from features precomputed by scripts/precompute_clip.py.
+        The cache holds the raw CLIP outputs ('hidden_state', 'global',
+        'noun_hidden_state', 'noun_global', 'phrase_index', 'pad_start',
+        'noun_pad_start'), so every text_type can be built with cheap numpy ops.
+        """
+        cached = np.load(join(self.clip_text_cache_dir, f"qid{qid}.npz"))
+        pad_start_idx = int(cached["pad_start"])
+        r = self.text_ratio
+
+        if self.text_type == 'org_hidden_state':
+            q_feat = torch.from_numpy(cached["hidden_state"][:pad_start_idx])
+            if self.q_feat_type == "last_hidden_state":
+                q_feat = q_feat[:self.max_q_l]
+
+        elif self.text_type == 'global_local_features':
+            q_feat = r * torch.from_numpy(cached["global"]) \
+                + (1 - r) * torch.from_numpy(cached["noun_global"])
+            q_feat = q_feat.unsqueeze(0)  # (1, D)
+
+        elif self.text_type == 'hidden_features':
+            sen_hidden_state = torch.from_numpy(cached["hidden_state"][:pad_start_idx])
+            if self.q_feat_type == "last_hidden_state":
+                sen_hidden_state = sen_hidden_state[:self.max_q_l]
+            text_ensemble = r * torch.from_numpy(cached["global"]) \
+                + (1 - r) * torch.from_numpy(cached["noun_global"])
+            text_ensemble = text_ensemble.unsqueeze(0)  # (1, D)
+            if self.normalize_t:
+                sen_hidden_state = sen_hidden_state / sen_hidden_state.norm(dim=-1, keepdim=True)
+                text_ensemble = text_ensemble / text_ensemble.norm(dim=1, keepdim=True)
+            q_feat = torch.concat((sen_hidden_state, text_ensemble), dim=0)
+            if self.txt_drop_ratio > 0:
+                q_feat = self.random_drop_rows(q_feat)
+            return q_feat
+
+        elif self.text_type == 'global_local_hidden_state':
+            sen_hidden_state = torch.from_numpy(cached["hidden_state"])
+            noun_hidden_state = torch.from_numpy(cached["noun_hidden_state"])
+            only_noun_hidden_state = torch.zeros_like(sen_hidden_state)
+            for idx in cached["phrase_index"]:
+                only_noun_hidden_state[idx+1] = noun_hidden_state[idx+1]
+            sen_hidden_state = sen_hidden_state[:pad_start_idx]
+            only_noun_hidden_state = only_noun_hidden_state[:pad_start_idx]
+            if self.q_feat_type == "last_hidden_state":
+                sen_hidden_state = sen_hidden_state[:self.max_q_l]
+                only_noun_hidden_state = only_noun_hidden_state[:self.max_q_l]
+            q_feat = r * sen_hidden_state + (1-r) * only_noun_hidden_state
+
+        elif self.text_type == 'only_local_hidden_state':
+            noun_pad_start_idx = int(cached["noun_pad_start"])
+            q_feat = torch.from_numpy(cached["noun_hidden_state"][:noun_pad_start_idx])
+            if self.q_feat_type == "last_hidden_state":
+                q_feat = q_feat[:self.max_q_l]
+
+        else:
+            raise NotImplementedError(f"unknown text_type {self.text_type}")
+
+        if self.normalize_t:
+            q_feat = q_feat / q_feat.norm(dim=-1, keepdim=True)
+        if self.txt_drop_ratio > 0:
+            q_feat = self.random_drop_rows(q_feat)
+        return q_feat  # (D, ) or (Lq, D)
+
+    def _cached_tokens(self, key, text):
+        """CLIP-tokenize `text` once per key ((qid,) or (qid, 'noun')) and also
+        cache pad_start, the index right after the last non-pad token."""
+        entry = self._tok_cache.get(key)
+        if entry is None:
+            tokens = clip.tokenize(text)[0]  # (77, ) on cpu
+            pad_start_idx = int(torch.nonzero(tokens).flatten()[-1]) + 1
+            entry = (tokens, pad_start_idx)
+            self._tok_cache[key] = entry
+        return entry
+
+    def _encode_text(self, tokens):
+        # fp16 autocast halves memory bandwidth on tensor-core GPUs; outputs
+        # are cast back to fp32 before any normalization
+        with torch.cuda.amp.autocast(enabled=str(self.device).startswith("cuda")):
+            return self.clip_model.encode_text(tokens).float()
+
+    def _encode_text_hidden_state(self, tokens):
+        with torch.cuda.amp.autocast(enabled=str(self.device).startswith("cuda")):
+            return self.clip_model.encode_text_hidden_state(tokens).float()
+
+    def _get_query_tokens(self, qid):
+        """Tokenize only (defer_clip_text mode); no CLIP forward here."""
+        doc = self._doc_cache[qid]
+        sentence_for_spacy = ' '.join(
+            token.text for token in doc if token.text != ' ')
+        noun_phrase, phrase_index, _ = extract_noun_phrase(doc, need_index=True)
+        sentence_tokens, sentence_pad_start = self._cached_tokens(qid, sentence_for_spacy)
+        noun_tokens, noun_pad_start = self._cached_tokens((qid, 'noun'), noun_phrase)
+        return dict(
+            sentence_tokens=sentence_tokens,
+            noun_tokens=noun_tokens,
+            sentence_pad_start=sentence_pad_start,
+            noun_pad_start=noun_pad_start,
+            phrase_index=torch.as_tensor(phrase_index, dtype=torch.long),
+        )
+
+    @torch.no_grad()
+    def encode_text_batch(self, query_tokens, device, non_blocking=False):
+        """Encode a whole mini-batch of query tokens in one CLIP forward
+        (defer_clip_text mode). Returns (src_txt, src_txt_mask) already on
+        `device`, mirroring what the per-sample _get_* methods produce.
+        """
+        sentence_tokens = query_tokens["sentence_tokens"].to(device, non_blocking=non_blocking)
+        noun_tokens = query_tokens["noun_tokens"].to(device, non_blocking=non_blocking)
+        phrase_index = query_tokens["phrase_index"]
+        r = self.text_ratio
+        # "last nonzero + 1" offsets cached by _cached_tokens; the BPE can
+        # emit token id 0 mid-sequence, so counting nonzeros would undercount
+        sen_lens = query_tokens["sentence_pad_start"]
+        noun_lens = query_tokens["noun_pad_start"]
+
+        if self.text_type == 'global_local_features':
+            both_features = self._encode_text(
+                torch.cat([sentence_tokens, noun_tokens], dim=0))
+            sentence_features = both_features[:len(sentence_tokens)]
+            noun_phrase_features = both_features[len(sentence_tokens):]
+            q_feat = r * sentence_features + (1-r) * noun_phrase_features  # (B, D)
+            if self.normalize_t:
+                q_feat = q_feat / q_feat.norm(dim=-1, keepdim=True)
+            if self.txt_drop_ratio > 0:
+                # per-sample semantics: each query is its own (1, D) feature,
+                # dropped independently as in _get_global_local_features
+                for i in range(len(q_feat)):
+                    self.random_drop_rows(q_feat[i:i+1])
+            mask = torch.ones(len(q_feat), 1, dtype=torch.float32, device=device)
+            return q_feat.unsqueeze(1), mask  # (B, 1, D)
+
+        feats = []
+        if self.text_type == 'org_hidden_state':
+            hidden_states = self._encode_text_hidden_state(sentence_tokens)
+            for i in range(len(hidden_states)):
+                q_feat = hidden_states[i][:sen_lens[i]]
+                if self.q_feat_type == "last_hidden_state":
+                    q_feat = q_feat[:self.max_q_l]
+                feats.append(q_feat)
+
+        elif self.text_type == 'hidden_features':
+            hidden_states = self._encode_text_hidden_state(sentence_tokens)
+            both_features = self._encode_text(
+                torch.cat([sentence_tokens, noun_tokens], dim=0))
+            sentence_features = both_features[:len(sentence_tokens)]
+            noun_phrase_features = both_features[len(sentence_tokens):]
+            text_ensemble = r * sentence_features + (1-r) * noun_phrase_features  # (B, D)
+            for i in range(len(hidden_states)):
+                sen_hidden_state = hidden_states[i][:sen_lens[i]]
+                if self.q_feat_type == "last_hidden_state":
+                    sen_hidden_state = sen_hidden_state[:self.max_q_l]
+                final_feat = text_ensemble[i:i+1]
+                if self.normalize_t:
+                    sen_hidden_state = sen_hidden_state / sen_hidden_state.norm(dim=-1, keepdim=True)
+                    final_feat = final_feat / final_feat.norm(dim=1, keepdim=True)
+                feats.append(torch.concat((sen_hidden_state, final_feat), dim=0))
+            if self.txt_drop_ratio > 0:
+                feats = [self.random_drop_rows(q_feat) for q_feat in feats]
+            padded, mask = pad_sequences_1d(feats, dtype=torch.float32, device=device)
+            return padded, mask
+
+        elif self.text_type == 'global_local_hidden_state':
+            both_hidden_states = self._encode_text_hidden_state(
+                torch.cat([sentence_tokens, noun_tokens], dim=0))
+            sen_hidden_states = both_hidden_states[:len(sentence_tokens)]
+            noun_hidden_states = both_hidden_states[len(sentence_tokens):]
+            for i in range(len(sen_hidden_states)):
+                only_noun_hidden_state = torch.zeros_like(sen_hidden_states[i])
+                idx = phrase_index[i].to(device) + 1
+                only_noun_hidden_state[idx] = noun_hidden_states[i][idx]
+                q_feat = r * sen_hidden_states[i] + (1-r) * only_noun_hidden_state
+                q_feat = q_feat[:sen_lens[i]]
+                if self.q_feat_type == "last_hidden_state":
+                    q_feat = q_feat[:self.max_q_l]
+                feats.append(q_feat)
+
+        elif self.text_type == 'only_local_hidden_state':
+            noun_hidden_states = self._encode_text_hidden_state(noun_tokens)
+            for i in range(len(noun_hidden_states)):
+                q_feat = noun_hidden_states[i][:noun_lens[i]]
+                if self.q_feat_type == "last_hidden_state":
+                    q_feat = q_feat[:self.max_q_l]
+                feats.append(q_feat)
+
+        else:
+            raise NotImplementedError(f"unknown text_type {self.text_type}")
+
+        if self.normalize_t:
+            feats = [q_feat / q_feat.norm(dim=-1, keepdim=True) for q_feat in feats]
+        if self.txt_drop_ratio > 0:
+            feats = [self.random_drop_rows(q_feat) for q_feat in feats]
+        padded, mask = pad_sequences_1d(feats, dtype=torch.float32, device=device)
+        return padded, mask
+
+    def _get_clip_text_feat(self, qid, query):
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
-            encoded_query = clip.tokenize([query]).to(self.device)
-            
+            tokens, pad_start_idx = self._cached_tokens((qid, 'raw'), [query])
+            encoded_query = tokens.unsqueeze(0).to(self.device)
+
             with torch.no_grad():
-                q_feat = self.clip_model.encode_text_hidden_state(encoded_query)
-                
-                pad_start_idx = torch.nonzero(encoded_query[0]).flatten()[-1] + 1
+                q_feat = self._encode_text_hidden_state(encoded_query)
                 q_feat = q_feat[0][:pad_start_idx]
 
             if self.q_feat_type == "last_hidden_state":
@@ -375,18 +691,17 @@ class StartEndDataset(Dataset):
 
         return q_feat  # (D, ) or (Lq, D)
 
-    def _get_global_local_features(self, query, r=0.5):
+    def _get_global_local_features(self, qid, r=0.5):
         # sentence -> final feature (global)
         # noun -> final feature (local)
         # final = global + local
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
 
-            query_ = query.lower()
-            doc = self.nlp(query_)
+            doc = self._doc_cache[qid]
 
             sentence_for_spacy = []
 
@@ -396,13 +711,15 @@ class StartEndDataset(Dataset):
                 sentence_for_spacy.append(token.text)
 
             sentence_for_spacy = ' '.join(sentence_for_spacy)
-            sentence_token = clip.tokenize(sentence_for_spacy).to(self.device)
-            noun_phrase, not_phrase_index, head_noun = self.extract_noun_phrase(sentence_for_spacy, need_index=True)
-            noun_phrase_token = clip.tokenize(noun_phrase).to(self.device)
+            sentence_token = self._cached_tokens(qid, sentence_for_spacy)[0].unsqueeze(0).to(self.device)
+            noun_phrase, not_phrase_index, head_noun = extract_noun_phrase(doc, need_index=True)
+            noun_phrase_token = self._cached_tokens((qid, 'noun'), noun_phrase)[0].unsqueeze(0).to(self.device)
 
             with torch.no_grad():
-                sentence_features =self.clip_model.encode_text(sentence_token)
-                noun_phrase_features = self.clip_model.encode_text(noun_phrase_token)
+                # sentence + noun phrase as one (2, 77) batch, halves the launches
+                both_features = self._encode_text(
+                    torch.cat([sentence_token, noun_phrase_token], dim=0))
+                sentence_features, noun_phrase_features = both_features[:1], both_features[1:]
 
             q_feat = r * sentence_features + (1-r) * noun_phrase_features
 
@@ -414,18 +731,17 @@ class StartEndDataset(Dataset):
 
         return q_feat  # (D, ) or (Lq, D)
 
-    def _get_hidden_features(self, query, r=0.5):
+    def _get_hidden_features(self, qid, r=0.5):
         # sentence -> last hidden state
         # sen + noun -> final feature
         # final = last hidden state + final feature
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
-  
-            query_ = query.lower()
-            doc = self.nlp(query_)
+
+            doc = self._doc_cache[qid]
 
             sentence_for_spacy = []
 
@@ -435,25 +751,25 @@ class StartEndDataset(Dataset):
                 sentence_for_spacy.append(token.text)
 
             sentence_for_spacy = ' '.join(sentence_for_spacy)
-            sentence_token = clip.tokenize(sentence_for_spacy).to(self.device)
-            noun_phrase, phrase_index, not_phase_index = self.extract_noun_phrase(sentence_for_spacy, need_index=True)
-            noun_phrase_token = clip.tokenize(noun_phrase).to(self.device)
+            sentence_tokens, pad_start_idx = self._cached_tokens(qid, sentence_for_spacy)
+            sentence_token = sentence_tokens.unsqueeze(0).to(self.device)
+            noun_phrase, phrase_index, not_phase_index = extract_noun_phrase(doc, need_index=True)
+            noun_phrase_token = self._cached_tokens((qid, 'noun'), noun_phrase)[0].unsqueeze(0).to(self.device)
+
 
-            
             with torch.no_grad():
                 # 1) sentence last hidden state
-                sen_hidden_state = self.clip_model.encode_text_hidden_state(sentence_token)
-
-                pad_start_idx = torch.nonzero(sentence_token[0]).flatten()[-1] + 1
+                sen_hidden_state = self._encode_text_hidden_state(sentence_token)
                 sen_hidden_state = sen_hidden_state[0][:pad_start_idx]
 
                 if self.q_feat_type == "last_hidden_state":
                     sen_hidden_state = sen_hidden_state[:self.max_q_l]
 
 
-                # 2) sen + noun final features
-                sentence_features =self.clip_model.encode_text(sentence_token)
-                noun_phrase_features = self.clip_model.encode_text(noun_phrase_token)
+                # 2) sen + noun final features as one (2, 77) batch
+                both_features = self._encode_text(
+                    torch.cat([sentence_token, noun_phrase_token], dim=0))
+                sentence_features, noun_phrase_features = both_features[:1], both_features[1:]
 
             # 2) sen + noun final features
             text_ensemble = r * sentence_features + (1-r) * noun_phrase_features
@@ -471,18 +787,17 @@ class StartEndDataset(Dataset):
 
         return q_feat  # (D, ) or (Lq, D)
     
-    def _get_global_local_hidden_states(self, query, r=0.5):
+    def _get_global_local_hidden_states(self, qid, r=0.5):
         # sentence -> last hidden state (global)
         # noun -> last hidden state (local)
         # final = local + global
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
 
-            query_ = query.lower()
-            doc = self.nlp(query_)
+            doc = self._doc_cache[qid]
 
             sentence_for_spacy = []
 
@@ -492,23 +807,21 @@ class StartEndDataset(Dataset):
                 sentence_for_spacy.append(token.text)
 
             sentence_for_spacy = ' '.join(sentence_for_spacy)
-            sentence_token = clip.tokenize(sentence_for_spacy).to(self.device)
-            noun_phrase, phrase_index, not_phrase_index = self.extract_noun_phrase(sentence_for_spacy, need_index=True)
-            noun_phrase_token = clip.tokenize(noun_phrase).to(self.device)
-            
+            sentence_tokens, pad_start_idx = self._cached_tokens(qid, sentence_for_spacy)
+            sentence_token = sentence_tokens.unsqueeze(0).to(self.device)
+            noun_phrase, phrase_index, not_phrase_index = extract_noun_phrase(doc, need_index=True)
+            noun_phrase_token = self._cached_tokens((qid, 'noun'), noun_phrase)[0].unsqueeze(0).to(self.device)
+
             with torch.no_grad():
-                # 1) sentence last hidden state
-                sen_hidden_state = self.clip_model.encode_text_hidden_state(sentence_token)
-        
-                # 2) noun last hidden state
-                noun_hidden_state = self.clip_model.encode_text_hidden_state(noun_phrase_token)
-                
+                # 1) + 2) sentence and noun last hidden states as one (2, 77) batch
+                both_hidden_states = self._encode_text_hidden_state(
+                    torch.cat([sentence_token, noun_phrase_token], dim=0))
+                sen_hidden_state, noun_hidden_state = both_hidden_states[:1], both_hidden_states[1:]
+
                 only_noun_hidden_state = torch.zeros_like(sen_hidden_state)
                 for idx in phrase_index:
                     only_noun_hidden_state[0][idx+1] = noun_hidden_state[0][idx+1]
 
-                pad_start_idx = torch.nonzero(sentence_token[0]).flatten()[-1] + 1
-
                 sen_hidden_state = sen_hidden_state[0][:pad_start_idx]
                 only_noun_hidden_state = only_noun_hidden_state[0][:pad_start_idx]
 
@@ -529,36 +842,26 @@ class StartEndDataset(Dataset):
 
         return q_feat  # (D, ) or (Lq, D)
 
-    def _get_only_noun_hidden_states(self, query):
+    def _get_only_noun_hidden_states(self, qid):
         # sentence -> last hidden state (global)
         # noun -> last hidden state (local)
         # final = local + global
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             q_feat = np.load(join(self.q_feat_dir, "{}.npz".format(qid))) # 'token', 'text'
             return torch.from_numpy(q_feat['token'])
         else:
             # QVhighlight dataset
 
-            query_ = query.lower()
-            doc = self.nlp(query_)
+            doc = self._doc_cache[qid]
 
-            sentence_for_spacy = []
+            noun_phrase, phrase_index, not_phrase_index = extract_noun_phrase(doc, need_index=True)
+            noun_tokens, pad_start_idx = self._cached_tokens((qid, 'noun'), noun_phrase)
+            noun_phrase_token = noun_tokens.unsqueeze(0).to(self.device)
 
-            for i, token in enumerate(doc):
-                if token.text == ' ':
-                    continue
-                sentence_for_spacy.append(token.text)
-
-            sentence_for_spacy = ' '.join(sentence_for_spacy)
-            noun_phrase, phrase_index, not_phrase_index = self.extract_noun_phrase(sentence_for_spacy, need_index=True)
-            noun_phrase_token = clip.tokenize(noun_phrase).to(self.device)
-            
             with torch.no_grad():
 
                 # noun last hidden state
-                noun_hidden_state = self.clip_model.encode_text_hidden_state(noun_phrase_token)
-
-                pad_start_idx = torch.nonzero(noun_phrase_token[0]).flatten()[-1] + 1
+                noun_hidden_state = self._encode_text_hidden_state(noun_phrase_token)
 
                 q_feat = noun_hidden_state[0][:pad_start_idx]
 
@@ -573,51 +876,6 @@ class StartEndDataset(Dataset):
 
         return q_feat  # (D, ) or (Lq, D)
     
-    def extract_noun_phrase(self, text, need_index=False):
-        
-        text = text.lower()
-
-        doc = self.nlp(text)
-
-        chunks = {}
-        chunks_index = {}
-        for chunk in doc.noun_chunks:
-            for i in range(chunk.start, chunk.end):
-                chunks[i] = chunk
-                chunks_index[i] = (chunk.start, chunk.end)
-
-        for token in doc:
-            if token.head.i == token.i:
-                head = token.head
-
-        if head.i not in chunks:
-            children = list(head.children)
-            if children and children[0].i in chunks:
-                head = children[0]
-            else:
-                if need_index:
-                    return text, [], text
-                else:
-                    return text
-
-        head_index = chunks_index[head.i]
-        head_index = [i for i in range(head_index[0], head_index[1])]
-
-        sentence_index = [i for i in range(len(doc))]
-        phrase_index = []
-        not_phrase_index = []
-        for i in sentence_index:
-            if i in head_index:
-                phrase_index.append(i)
-            else:
-                not_phrase_index.append(i)
-
-        head = chunks[head.i]
-        if need_index:
-            return head.text, phrase_index, not_phrase_index
-        else:
-            return head.text
-
     def random_drop_rows(self, embeddings):
         """randomly mask num_drop rows in embeddings to be zero.
         Args:
@@ -631,14 +889,14 @@ class StartEndDataset(Dataset):
         return embeddings
 
     def _get_video_feat_by_vid(self, vid):
-        if self.dset_name == 'tvsum':
+        if self._is_tvsum:
             v_feat_list = []
             for _feat_dir in self.v_feat_dirs:
                 _feat_path = join(_feat_dir, f"{vid}_rgb.npy")
-                _feat_rgb = np.load(_feat_path)[:self.max_v_l].astype(np.float32)
+                _feat_rgb = np.load(_feat_path, mmap_mode='r')[:self.max_v_l].astype(np.float32)
 
                 _feat_path = join(_feat_dir, f"{vid}_opt.npy")
-                _feat_opt = np.load(_feat_path)[:self.max_v_l].astype(np.float32)
+                _feat_opt = np.load(_feat_path, mmap_mode='r')[:self.max_v_l].astype(np.float32)
                 
                 _feat = np.concatenate([_feat_rgb, _feat_opt], axis=-1)
                 # _feat = _feat_rgb
@@ -653,10 +911,16 @@ class StartEndDataset(Dataset):
         else:
             v_feat_list = []
             for _feat_dir in self.v_feat_dirs:
-                _feat_path = join(_feat_dir, f"{vid}.npz")
-                _feat = np.load(_feat_path)["features"][:self.max_v_l].astype(np.float32)
-                if self.normalize_v:
-                    _feat = l2_normalize_np_array(_feat)
+                _feat_npy_path = join(_feat_dir, f"{vid}.npy")
+                if exists(_feat_npy_path):
+                    # converted by scripts/convert_features_to_npy.py; mmap so
+                    # only the needed prefix is read, and the cache is already
+                    # L2-normalized at conversion time
+                    _feat = np.load(_feat_npy_path, mmap_mode='r')[:self.max_v_l].astype(np.float32)
+                else:
+                    _feat = np.load(join(_feat_dir, f"{vid}.npz"))["features"][:self.max_v_l].astype(np.float32)
+                    if self.normalize_v:
+                        _feat = l2_normalize_np_array(_feat)
                 v_feat_list.append(_feat)
             # some features are slightly longer than the others
             min_len = min([len(e) for e in v_feat_list])
@@ -666,7 +930,7 @@ class StartEndDataset(Dataset):
 
 
 
-def start_end_collate(batch):
+def start_end_collate(batch, max_v_l=None, max_q_l=None):
     batch_meta = [e["meta"] for e in batch]  # seems no need to collate ?
 
     model_inputs_keys = batch[0]["model_inputs"].keys()
@@ -676,27 +940,66 @@ def start_end_collate(batch):
             batched_data[k] = [dict(spans=e["model_inputs"]["span_labels"]) for e in batch]
             continue
         if k in ["saliency_pos_labels", "saliency_neg_labels"]:
-            batched_data[k] = torch.LongTensor([e["model_inputs"][k] for e in batch])
+            batched_data[k] = torch.as_tensor(
+                np.asarray([e["model_inputs"][k] for e in batch]), dtype=torch.long)
             continue
         if k == "saliency_all_labels":
-            pad_data, mask_data = pad_sequences_1d([e["model_inputs"][k] for e in batch], dtype=np.float32, fixed_length=None)
-            # print(pad_data, mask_data)
-            batched_data[k] = torch.tensor(pad_data, dtype=torch.float32)
+            # loss_saliency multiplies these elementwise with scores of shape
+            # (N, max_v_l), so pad to the same fixed length as video_feat;
+            # score arrays can be ctx_l+1 long (windows may end at ctx_l)
+            pad_data, mask_data = pad_sequences_1d(
+                [e["model_inputs"][k][:max_v_l] for e in batch], dtype=np.float32, fixed_length=max_v_l)
+            # pad_data is already float32, as_tensor shares its memory
+            batched_data[k] = torch.as_tensor(pad_data)
             continue
         if k == "moment_class":
             batched_data[k] = [dict(m_cls=e["model_inputs"]["moment_class"]) for e in batch]
             continue
+        if k == "query_tokens":
+            batched_data[k] = dict(
+                sentence_tokens=torch.stack([e["model_inputs"][k]["sentence_tokens"] for e in batch]),  # (B, 77)
+                noun_tokens=torch.stack([e["model_inputs"][k]["noun_tokens"] for e in batch]),  # (B, 77)
+                sentence_pad_start=torch.as_tensor(
+                    [e["model_inputs"][k]["sentence_pad_start"] for e in batch], dtype=torch.long),  # (B, )
+                noun_pad_start=torch.as_tensor(
+                    [e["model_inputs"][k]["noun_pad_start"] for e in batch], dtype=torch.long),  # (B, )
+                phrase_index=[e["model_inputs"][k]["phrase_index"] for e in batch])
+            continue
 
+        # padding to max_v_l/max_q_l keeps every batch the same shape, so the
+        # CUDA caching allocator can reuse blocks; tef must match video_feat
+        if k in ("video_feat", "tef"):
+            fixed_length = max_v_l
+        elif k == "query_feat":
+            fixed_length = max_q_l
+        else:
+            fixed_length = None
+        # query/video features cross the worker->main pipe as float16 to halve
+        # IPC bandwidth; prepare_batch_inputs upcasts on device
         batched_data[k] = pad_sequences_1d(
-            [e["model_inputs"][k] for e in batch], dtype=torch.float32, fixed_length=None)
+            [e["model_inputs"][k] for e in batch], dtype=torch.float16, fixed_length=fixed_length)
+
+    if "tef" in batched_data:
+        # single concat on the padded contiguous blocks instead of per sample
+        pad_tef, _ = batched_data.pop("tef")
+        pad_vid, vid_mask = batched_data["video_feat"]
+        batched_data["video_feat"] = (torch.cat([pad_vid, pad_tef], dim=-1), vid_mask)
     return batch_meta, batched_data
 
 
-def prepare_batch_inputs(batched_model_inputs, device, non_blocking=False):
+def prepare_batch_inputs(batched_model_inputs, device, non_blocking=False, clip_text_encoder=None):
+    if "query_tokens" in batched_model_inputs:
+        # defer_clip_text mode: one batched CLIP forward per step instead of
+        # one per sample inside the workers
+        src_txt, src_txt_mask = clip_text_encoder(
+            batched_model_inputs["query_tokens"], device, non_blocking=non_blocking)
+    else:
+        src_txt = batched_model_inputs["query_feat"][0].to(device, dtype=torch.float32, non_blocking=non_blocking)
+        src_txt_mask = batched_model_inputs["query_feat"][1].to(device, non_blocking=non_blocking)
     model_inputs = dict(
-        src_txt=batched_model_inputs["query_feat"][0].to(device, non_blocking=non_blocking),
-        src_txt_mask=batched_model_inputs["query_feat"][1].to(device, non_blocking=non_blocking),
-        src_vid=batched_model_inputs["video_feat"][0].to(device, non_blocking=non_blocking),
+        src_txt=src_txt,
+        src_txt_mask=src_txt_mask,
+        src_vid=batched_model_inputs["video_feat"][0].to(device, dtype=torch.float32, non_blocking=non_blocking),
         src_vid_mask=batched_model_inputs["video_feat"][1].to(device, non_blocking=non_blocking),
     )
     targets = {}
@@ -6,6 +6,7 @@ import random
 import numpy as np
 from tqdm import tqdm, trange
 from collections import defaultdict
+from functools import partial
 
 import torch
 import torch.nn as nn
@@ -56,7 +57,9 @@ def train_epoch(model, criterion, train_loader, optimizer, opt, epoch_i, tb_writ
 
         timer_start = time.time()
         if opt.a_feat_dir is None:
-            model_inputs, targets = prepare_batch_inputs(batch[1], opt.device, non_blocking=opt.pin_memory)
+            model_inputs, targets = prepare_batch_inputs(
+                batch[1], opt.device, non_blocking=opt.pin_memory,
+                clip_text_encoder=getattr(train_loader.dataset, "encode_text_batch", None))
         else:
             model_inputs, targets = prepare_batch_inputs_audio(batch[1], opt.device, non_blocking=opt.pin_memory)
         time_meters["prepare_inputs_time"].update(time.time() - timer_start)
@@ -111,14 +114,21 @@ def train(model, criterion, optimizer, lr_scheduler, train_dataset, val_dataset,
     opt.train_log_txt_formatter = "{time_str} [Epoch] {epoch:03d} [Loss] {loss_str}\n"
     opt.eval_log_txt_formatter = "{time_str} [Epoch] {epoch:03d} [Loss] {loss_str} [Metrics] {eval_metrics_str}\n"
 
+    # keep workers (and their spaCy/CLIP state) alive across epochs
+    loader_kwargs = dict(persistent_workers=True, prefetch_factor=4) if opt.num_workers > 0 else {}
     if opt.a_feat_dir is None:
         train_loader = DataLoader(
             train_dataset,
-            collate_fn=start_end_collate,
+            collate_fn=partial(start_end_collate, max_v_l=opt.max_v_l,
+                               # cliptext query lengths can exceed max_q_l (e.g. the
+                               # hidden_features extra row) and tvsum token features
+                               # are never truncated, keep those variable
+                               max_q_l=None if (opt.use_cliptext or opt.dset_name == 'tvsum') else opt.max_q_l),
             batch_size=opt.bsz,
             num_workers=opt.num_workers,
             shuffle=True,
-            pin_memory=opt.pin_memory
+            pin_memory=opt.pin_memory,
+            **loader_kwargs
         )
     else:
         train_loader = DataLoader(
@@ -127,7 +137,8 @@ def train(model, criterion, optimizer, lr_scheduler, train_dataset, val_dataset,
             batch_size=opt.bsz,
             num_workers=opt.num_workers,
             shuffle=True,
-            pin_memory=opt.pin_memory
+            pin_memory=opt.pin_memory,
+            **loader_kwargs
         )
 
     prev_best_score = 0.
@@ -229,13 +240,20 @@ def train_hl(model, criterion, optimizer, lr_scheduler, train_dataset, val_datas
     opt.train_log_txt_formatter = "{time_str} [Epoch] {epoch:03d} [Loss] {loss_str}\n"
     opt.eval_log_txt_formatter = "{time_str} [Epoch] {epoch:03d} [Loss] {loss_str} [Metrics] {eval_metrics_str}\n"
 
+    # keep workers (and their spaCy/CLIP state) alive across epochs
+    loader_kwargs = dict(persistent_workers=True, prefetch_factor=4) if opt.num_workers > 0 else {}
     train_loader = DataLoader(
         train_dataset,
-        collate_fn=start_end_collate,
+        collate_fn=partial(start_end_collate, max_v_l=opt.max_v_l,
+                               # cliptext query lengths can exceed max_q_l (e.g. the
+                               # hidden_features extra row) and tvsum token features
+                               # are never truncated, keep those variable
+                               max_q_l=None if (opt.use_cliptext or opt.dset_name == 'tvsum') else opt.max_q_l),
         batch_size=opt.bsz,
         num_workers=opt.num_workers,
         shuffle=True,
-        pin_memory=opt.pin_memory
+        pin_memory=opt.pin_memory,
+        **loader_kwargs
     )
 
     prev_best_score = 0.
@@ -332,6 +350,13 @@ def start_training():
     logger.info("Setup config, data and model...")
     opt = BaseOptions().parse()
     set_seed(opt.seed)
+    # pin the fork start method so DataLoader workers share the spaCy/CLIP
+    # singletons copy-on-write (see qd_detr/_heavy_models.py); the datasets
+    # below load them in the main process, before any worker forks
+    try:
+        torch.multiprocessing.set_start_method("fork")
+    except RuntimeError:  # context already set
+        pass
     if opt.debug:  # keep the model run deterministically
         # 'cudnn.benchmark = True' enabled auto finding the best algorithm for a specific input/net config.
         # Enable this only when input size is fixed.
@@ -353,6 +378,8 @@ def start_training():
             ctx_mode=opt.ctx_mode,
             use_cliptext=opt.use_cliptext,
             text_ratio=opt.text_ratio,
+            clip_text_cache_dir=opt.clip_text_cache_dir,
+            defer_clip_text=opt.defer_clip_text,
             data_ratio=opt.data_ratio,
             normalize_v=not opt.no_norm_vfeat,
             normalize_t=not opt.no_norm_tfeat,
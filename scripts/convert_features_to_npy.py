@@ -0,0 +1,51 @@
+"""One-time conversion of feature .npz archives into raw .npy files.
+
+np.load on an .npz reads and decodes the whole archive every call, even
+though the dataset only keeps the [:max_v_l] / [:max_q_l] prefix. Raw
+.npy files can be opened with mmap_mode='r', so the OS page cache
+delivers only the pages that are actually sliced. StartEndDataset picks
+up the .npy files automatically when they sit next to the .npz ones.
+
+The arrays are L2-normalized at conversion time (unless --no_normalize is
+given), so the per-sample l2_normalize_np_array pass is skipped when
+loading from the .npy cache. Use --no_normalize only when training with
+--no_norm_vfeat / --no_norm_tfeat.
+
+Usage:
+python scripts/convert_features_to_npy.py --feat_dir features/slowfast_features
+python scripts/convert_features_to_npy.py --feat_dir features/clip_text_features --key last_hidden_state
+"""
+import argparse
+import glob
+import os
+from os.path import join, basename
+
+import numpy as np
+from tqdm import tqdm
+
+from utils.basic_utils import l2_normalize_np_array
+
+
+def convert(args):
+    npz_files = sorted(glob.glob(join(args.feat_dir, "*.npz")))
+    out_dir = args.out_dir if args.out_dir is not None else args.feat_dir
+    os.makedirs(out_dir, exist_ok=True)
+    for npz_path in tqdm(npz_files, desc="Converting"):
+        feat = np.load(npz_path)[args.key]
+        if not args.no_normalize:
+            feat = l2_normalize_np_array(feat.astype(np.float32))
+        np.save(join(out_dir, basename(npz_path).replace(".npz", ".npy")), feat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feat_dir", type=str, required=True,
+                        help="dir with {vid}.npz / qid{qid}.npz feature files")
+    parser.add_argument("--out_dir", type=str, default=None,
+                        help="output dir, defaults to --feat_dir")
+    parser.add_argument("--key", type=str, default="features",
+                        help="array key inside the npz, "
+                             "'features' for video, 'last_hidden_state' for text")
+    parser.add_argument("--no_normalize", action="store_true",
+                        help="do not L2-normalize the arrays before saving")
+    convert(parser.parse_args())
@@ -0,0 +1,90 @@
+"""Precompute CLIP text features for StartEndDataset.
+
+Runs the CLIP/spaCy work of the `use_cliptext` text paths once, offline,
+and writes one `qid{qid}.npz` file per query into `--cache_dir`. The raw
+components ('hidden_state', 'global', 'noun_hidden_state', 'noun_global',
+'phrase_index', 'pad_start', 'noun_pad_start') are stored, so every
+text_type can be assembled at load time without touching the GPU.
+Point `--clip_text_cache_dir` at the cache dir to use it during training.
+
+Usage:
+PYTHONPATH=$PYTHONPATH:. python scripts/precompute_clip.py \
+    --data_paths data/highlight_train_release.jsonl data/highlight_val_release.jsonl \
+    --clip_type ViT-B/32 --cache_dir features/clip_text_cache
+"""
+import argparse
+import os
+from os.path import join
+
+import numpy as np
+import torch
+from tqdm import tqdm
+import spacy
+
+import clip
+import CLIP
+from utils.basic_utils import load_jsonl
+from qd_detr.start_end_dataset import extract_noun_phrase
+
+
+@torch.no_grad()
+def precompute(args):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    clip_model, _ = CLIP.load(args.clip_type, device=device)
+    nlp = spacy.load('en_core_web_lg', disable=['ner', 'lemmatizer'])
+
+    data = []
+    for data_path in args.data_paths:
+        data.extend(load_jsonl(data_path))
+    # the same qid may appear in several splits, encode it once
+    seen = set()
+    data = [d for d in data if not (d["qid"] in seen or seen.add(d["qid"]))]
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    for chunk_start in tqdm(range(0, len(data), args.batch_size), desc="Encoding queries"):
+        chunk = data[chunk_start:chunk_start + args.batch_size]
+        docs = nlp.pipe([d["query"].lower() for d in chunk], batch_size=args.batch_size)
+
+        sentences = []
+        noun_phrases = []
+        phrase_indices = []
+        for doc in docs:
+            sentence_for_spacy = ' '.join(
+                token.text for token in doc if token.text != ' ')
+            sentences.append(sentence_for_spacy)
+            noun_phrase, phrase_index, _ = extract_noun_phrase(doc, need_index=True)
+            noun_phrases.append(noun_phrase)
+            phrase_indices.append(phrase_index)
+
+        sentence_tokens = clip.tokenize(sentences).to(device)
+        noun_tokens = clip.tokenize(noun_phrases).to(device)
+
+        sen_hidden = clip_model.encode_text_hidden_state(sentence_tokens).float().cpu().numpy()
+        noun_hidden = clip_model.encode_text_hidden_state(noun_tokens).float().cpu().numpy()
+        sen_global = clip_model.encode_text(sentence_tokens).float().cpu().numpy()
+        noun_global = clip_model.encode_text(noun_tokens).float().cpu().numpy()
+
+        for i, d in enumerate(chunk):
+            pad_start = int(torch.nonzero(sentence_tokens[i]).flatten()[-1]) + 1
+            noun_pad_start = int(torch.nonzero(noun_tokens[i]).flatten()[-1]) + 1
+            np.savez(
+                join(args.cache_dir, f"qid{d['qid']}.npz"),
+                hidden_state=sen_hidden[i],
+                noun_hidden_state=noun_hidden[i],
+                noun_global=noun_global[i],
+                phrase_index=np.asarray(phrase_indices[i], dtype=np.int64),
+                pad_start=pad_start,
+                noun_pad_start=noun_pad_start,
+                **{'global': sen_global[i]},  # 'global' is a keyword, cannot be a kwarg
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data_paths", type=str, nargs="+", required=True,
+                        help="jsonl annotation files, e.g. train + val splits")
+    parser.add_argument("--clip_type", type=str, default="ViT-B/32")
+    parser.add_argument("--cache_dir", type=str, required=True)
+    parser.add_argument("--batch_size", type=int, default=256)
+    precompute(parser.parse_args())